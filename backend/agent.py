@@ -1,8 +1,140 @@
 import random
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Sequence, Tuple
 import re
 
+WORD_RE = re.compile(r"[a-z]+")
+
+# Context keyword sets, matched against the words of recent messages
+BANK_WORDS = frozenset(["bank"])
+UPI_WORDS = frozenset(["upi"])
+KYC_WORDS = frozenset(["kyc"])
+URGENT_WORDS = frozenset(["urgent", "immediate", "immediately", "now"])
+LINK_WORDS = frozenset(["link", "click"])
+MONEY_WORDS = frozenset(["money", "payment", "deposit", "transfer"])
+
+def message_lower(message: Dict[str, Any]) -> str:
+    """Lowercased message text, cached on the message under '_lower'"""
+    text_lower = message.get("_lower")
+    if text_lower is None:
+        # str.lower already has an ASCII fast path; an encode/translate/decode
+        # round trip through a bytes table measured about 3x slower, so the
+        # win is in lowercasing each message only once
+        text_lower = message["_lower"] = message["text"].lower()
+    return text_lower
+
+def message_tokens(message: Dict[str, Any]) -> frozenset:
+    """Set of words in the message, cached on the message under '_tokens'"""
+    tokens = message.get("_tokens")
+    if tokens is None:
+        tokens = message["_tokens"] = frozenset(WORD_RE.findall(message_lower(message)))
+    return tokens
+
+INITIAL_RESPONSES = (
+    "Hello? Who is this?",
+    "I'm not sure I understand. What is this about?",
+    "Can you tell me who you are and why you're contacting me?",
+    "Sorry, I think you might have the wrong person."
+)
+
+# Base responses per conversation stage
+STAGE_RESPONSES = {
+    # Initial stage - show concern/curiosity
+    0: (
+        "Oh no, what happened? Why is there an issue with my account?",
+        "I'm confused, which account are you talking about?",
+        "Is this serious? Should I be worried?",
+        "Can you tell me more about what's going on?",
+        "I don't understand, what seems to be the problem?"
+    ),
+    # Engagement stage - show interest and ask for details
+    1: (
+        "That sounds concerning. What do I need to do exactly?",
+        "I see. Can you walk me through the process step by step?",
+        "Okay, I understand. What's the first thing I should do?",
+        "Thank you for letting me know. How can I resolve this quickly?"
+    ),
+    # Information seeking - ask for specific details
+    2: (
+        "Can you provide more details about the verification process?",
+        "What information do you need from me exactly?",
+        "Is there a website or official portal I should visit?",
+        "How can I confirm this is legitimate?"
+    ),
+    # Verification stage - ask for confirmation
+    3: (
+        "I want to make sure this is legitimate. Can you verify your identity?",
+        "How can I confirm you're actually from the bank/organization?",
+        "Is there a customer service number I can call to verify this?",
+        "Can you provide any reference number or case ID for this issue?"
+    ),
+    # Advanced stage - more sophisticated engagement
+    4: (
+        "I've been getting similar messages lately. How do I know this isn't a scam?",
+        "My friend warned me about fraud attempts. Can you prove this is genuine?",
+        "I think I should contact my bank directly to confirm this.",
+        "Can you share your employee ID or official identification?"
+    )
+}
+
+# Extra responses per stage, added when the named context flag is set
+STAGE_CONTEXT_RESPONSES = {
+    0: (
+        ("mentions_bank", (
+            "Which bank is this regarding? I have accounts in multiple banks.",
+            "Is this about my SBI account or HDFC account?"
+        )),
+    ),
+    1: (
+        ("mentions_urgent", (
+            "This seems urgent. What happens if I don't act immediately?",
+            "I'm a bit scared now. Please help me understand this better."
+        )),
+    ),
+    2: (
+        ("mentions_upi", (
+            "Which UPI ID should I use? I have multiple payment apps.",
+            "Should I use my Google Pay UPI or PhonePe UPI?"
+        )),
+        ("mentions_link", (
+            "Can you send me the official link? I want to make sure it's authentic.",
+            "Is there a government website I should check?"
+        )),
+    ),
+    3: (
+        ("mentions_money", (
+            "Why do I need to make a payment to resolve this?",
+            "Is there any fee involved? How much exactly?"
+        )),
+    ),
+    4: (
+        ("mentions_kyc", (
+            "But I already completed my KYC last year. Why do I need to do it again?",
+            "Should I visit my bank branch for KYC verification instead?"
+        )),
+    )
+}
+
+def _build_response_pools() -> Dict[Tuple[int, int], Tuple[str, ...]]:
+    """
+    Precompute the response pool for every (stage, context flag mask) pair.
+    Bit i of the mask is set when the stage's i-th context flag is present.
+    """
+    pools = {}
+    for stage, base in STAGE_RESPONSES.items():
+        extras = STAGE_CONTEXT_RESPONSES[stage]
+        for mask in range(1 << len(extras)):
+            pool = list(base)
+            for bit, (_, responses) in enumerate(extras):
+                if mask & (1 << bit):
+                    pool.extend(responses)
+            pools[stage, mask] = tuple(pool)
+    return pools
+
+RESPONSE_POOLS = _build_response_pools()
+
 class ConversationalAgent:
+    __slots__ = ("persona_traits", "current_persona")
+    
     def __init__(self):
         self.persona_traits = [
             "concerned_citizen", "curious_user", "skeptical_person",
@@ -10,14 +142,14 @@ class ConversationalAgent:
         ]
         self.current_persona = random.choice(self.persona_traits)
         
-    def generate_contextual_response(self, history: List[Dict[str, Any]]) -> str:
+    def generate_contextual_response(self, history: Sequence[Dict[str, Any]]) -> str:
         """
         Generate human-like responses based on conversation context
         """
         if not history:
             return self._get_initial_response()
         
-        last_message = history[-1]["text"].lower()
+        last_message = message_lower(history[-1])
         message_count = len(history)
         
         # Analyze conversation context
@@ -28,19 +160,19 @@ class ConversationalAgent:
         
         return response
     
-    def _analyze_context(self, history: List[Dict[str, Any]]) -> Dict[str, Any]:
+    def _analyze_context(self, history: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze conversation context for better responses"""
-        recent_messages = [msg["text"].lower() for msg in history[-3:]]
+        # Index from the end so a deque works as well as a list
+        recent_messages = [history[i] for i in range(-min(len(history), 3), 0)]
+        recent_words = frozenset().union(*(message_tokens(msg) for msg in recent_messages))
         
         context = {
-            "mentions_bank": any("bank" in msg for msg in recent_messages),
-            "mentions_upi": any("upi" in msg for msg in recent_messages),
-            "mentions_kyc": any("kyc" in msg for msg in recent_messages),
-            "mentions_urgent": any(urgent in msg for msg in recent_messages 
-                                 for urgent in ["urgent", "immediate", "now"]),
-            "mentions_link": any("link" in msg or "click" in msg for msg in recent_messages),
-            "mentions_money": any(word in msg for msg in recent_messages 
-                               for word in ["money", "payment", "deposit", "transfer"]),
+            "mentions_bank": bool(recent_words & BANK_WORDS),
+            "mentions_upi": bool(recent_words & UPI_WORDS),
+            "mentions_kyc": bool(recent_words & KYC_WORDS),
+            "mentions_urgent": bool(recent_words & URGENT_WORDS),
+            "mentions_link": bool(recent_words & LINK_WORDS),
+            "mentions_money": bool(recent_words & MONEY_WORDS),
             "conversation_stage": min(len(history) // 2, 4)  # 0-4 stages
         }
         
@@ -48,125 +180,24 @@ class ConversationalAgent:
     
     def _craft_response(self, context: Dict[str, Any], last_message: str, message_count: int) -> str:
         """Craft response based on context and persona"""
+        stage = context["conversation_stage"]
         
-        # Stage-based responses
-        if context["conversation_stage"] == 0:
-            return self._get_initial_stage_response(context)
-        elif context["conversation_stage"] == 1:
-            return self._get_engagement_response(context)
-        elif context["conversation_stage"] == 2:
-            return self._get_information_seeking_response(context)
-        elif context["conversation_stage"] == 3:
-            return self._get_verification_response(context)
-        else:
-            return self._get_advanced_response(context)
-    
-    def _get_initial_stage_response(self, context: Dict[str, Any]) -> str:
-        """Initial stage responses - show concern/curiosity"""
-        responses = [
-            "Oh no, what happened? Why is there an issue with my account?",
-            "I'm confused, which account are you talking about?",
-            "Is this serious? Should I be worried?",
-            "Can you tell me more about what's going on?",
-            "I don't understand, what seems to be the problem?"
-        ]
-        
-        if context["mentions_bank"]:
-            responses.extend([
-                "Which bank is this regarding? I have accounts in multiple banks.",
-                "Is this about my SBI account or HDFC account?"
-            ])
+        # Each stage pool is prebuilt for every combination of its context flags
+        mask = 0
+        for bit, (flag, _) in enumerate(STAGE_CONTEXT_RESPONSES[stage]):
+            if context[flag]:
+                mask |= 1 << bit
         
-        return random.choice(responses)
-    
-    def _get_engagement_response(self, context: Dict[str, Any]) -> str:
-        """Engagement stage - show interest and ask for details"""
-        responses = [
-            "That sounds concerning. What do I need to do exactly?",
-            "I see. Can you walk me through the process step by step?",
-            "Okay, I understand. What's the first thing I should do?",
-            "Thank you for letting me know. How can I resolve this quickly?"
-        ]
-        
-        if context["mentions_urgent"]:
-            responses.extend([
-                "This seems urgent. What happens if I don't act immediately?",
-                "I'm a bit scared now. Please help me understand this better."
-            ])
-        
-        return random.choice(responses)
-    
-    def _get_information_seeking_response(self, context: Dict[str, Any]) -> str:
-        """Information seeking - ask for specific details"""
-        responses = [
-            "Can you provide more details about the verification process?",
-            "What information do you need from me exactly?",
-            "Is there a website or official portal I should visit?",
-            "How can I confirm this is legitimate?"
-        ]
-        
-        if context["mentions_upi"]:
-            responses.extend([
-                "Which UPI ID should I use? I have multiple payment apps.",
-                "Should I use my Google Pay UPI or PhonePe UPI?"
-            ])
-        
-        if context["mentions_link"]:
-            responses.extend([
-                "Can you send me the official link? I want to make sure it's authentic.",
-                "Is there a government website I should check?"
-            ])
-        
-        return random.choice(responses)
-    
-    def _get_verification_response(self, context: Dict[str, Any]) -> str:
-        """Verification stage - ask for confirmation"""
-        responses = [
-            "I want to make sure this is legitimate. Can you verify your identity?",
-            "How can I confirm you're actually from the bank/organization?",
-            "Is there a customer service number I can call to verify this?",
-            "Can you provide any reference number or case ID for this issue?"
-        ]
-        
-        if context["mentions_money"]:
-            responses.extend([
-                "Why do I need to make a payment to resolve this?",
-                "Is there any fee involved? How much exactly?"
-            ])
-        
-        return random.choice(responses)
-    
-    def _get_advanced_response(self, context: Dict[str, Any]) -> str:
-        """Advanced stage - more sophisticated engagement"""
-        responses = [
-            "I've been getting similar messages lately. How do I know this isn't a scam?",
-            "My friend warned me about fraud attempts. Can you prove this is genuine?",
-            "I think I should contact my bank directly to confirm this.",
-            "Can you share your employee ID or official identification?"
-        ]
-        
-        if context["mentions_kyc"]:
-            responses.extend([
-                "But I already completed my KYC last year. Why do I need to do it again?",
-                "Should I visit my bank branch for KYC verification instead?"
-            ])
-        
-        return random.choice(responses)
+        return random.choice(RESPONSE_POOLS[stage, mask])
     
     def _get_initial_response(self) -> str:
         """Response for very first message"""
-        initial_responses = [
-            "Hello? Who is this?",
-            "I'm not sure I understand. What is this about?",
-            "Can you tell me who you are and why you're contacting me?",
-            "Sorry, I think you might have the wrong person."
-        ]
-        return random.choice(initial_responses)
+        return random.choice(INITIAL_RESPONSES)
 
 # Global agent instance
 agent = ConversationalAgent()
 
-def agent_reply(history: List[Dict[str, Any]]) -> str:
+def agent_reply(history: Sequence[Dict[str, Any]]) -> str:
     """
     Main function to generate agent response
     Maintains backward compatibility with existing code
@@ -1,3 +1,5 @@
 import os
 API_KEY = os.getenv("API_KEY", "SECRET123")
 GUVI_CALLBACK = "https://hackathon.guvi.in/api/updateHoneyPotFinalResult"
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
@@ -1,5 +1,10 @@
 import re
-from typing import Tuple, List
+from typing import Tuple, List, Optional, Set
+
+import ahocorasick
+
+from extractor import SUSPICIOUS_WORDS
+from pattern_db import build_database, matching_ids
 
 # Enhanced scam detection patterns
 SCAM_KEYWORDS = [
@@ -27,52 +32,144 @@ PHISHING_PATTERNS = [
     r"\bupdate.*details\b", r"\bconfirm.*information\b"
 ]
 
-def calculate_scam_score(text: str) -> Tuple[bool, List[str], float]:
+URL_PATTERN = r"https?://[^\s]+"
+PHONE_PATTERN = r"\+?\d{10,}"
+
+# Pattern categories as small ints; labels are only looked up for the result
+CAT_URGENCY, CAT_FINANCIAL, CAT_PHISHING, CAT_LINK, CAT_PHONE = range(5)
+CATEGORY_LABELS = (
+    "urgency_tactic", "financial_threat", "phishing_attempt",
+    "suspicious_link", "phone_number"
+)
+
+# Every scored pattern as (pattern, category, weight), in reporting order
+SCORED_PATTERNS = (
+    [(p, CAT_URGENCY, 0.25) for p in URGENCY_PATTERNS]
+    + [(p, CAT_FINANCIAL, 0.30) for p in FINANCIAL_PATTERNS]
+    + [(p, CAT_PHISHING, 0.20) for p in PHISHING_PATTERNS]
+    + [(URL_PATTERN, CAT_LINK, 0.15), (PHONE_PATTERN, CAT_PHONE, 0.10)]
+)
+SCORED_RES = [re.compile(p) for p, _, _ in SCORED_PATTERNS]
+
+# All scored patterns fused into one alternation so the text is scanned once.
+# Each branch is a zero-width lookahead, so a greedy ".*" match never hides
+# a later pattern; group g<i> maps back to SCORED_PATTERNS[i].
+COMBINED_RE = re.compile(
+    "|".join(f"(?=(?P<g{i}>{p}))" for i, (p, _, _) in enumerate(SCORED_PATTERNS))
+)
+GROUP_INDEX = {f"g{i}": i for i in range(len(SCORED_PATTERNS))}
+
+# The URL and phone patterns come last; texts with no "http" and no digit
+# cannot match them, so those branches are left out of the scan
+TEXT_PATTERN_COUNT = len(SCORED_PATTERNS) - 2
+COMBINED_TEXT_RE = re.compile(
+    "|".join(f"(?=(?P<g{i}>{p}))" for i, (p, _, _) in enumerate(SCORED_PATTERNS[:TEXT_PATTERN_COUNT]))
+)
+DIGIT_RE = re.compile(r"\d")
+
+# Shortest text that can reach the scam threshold ("urgent": keyword plus
+# urgency pattern); anything shorter is benign without scanning
+MIN_SCAM_LENGTH = 6
+
+# Hyperscan database over the same patterns (None when hyperscan is not installed)
+SCORED_DB = build_database(SCORED_RES)
+
+KEYWORD_WEIGHT = 0.15
+
+# Single-pass keyword matcher over SCAM_KEYWORDS and the extractor's
+# SUSPICIOUS_WORDS. Payload: (SCAM_KEYWORDS index or None, word, suspicious)
+KEYWORD_AUTOMATON = ahocorasick.Automaton()
+for _keyword in set(SCAM_KEYWORDS) | SUSPICIOUS_WORDS:
+    _index = SCAM_KEYWORDS.index(_keyword) if _keyword in SCAM_KEYWORDS else None
+    KEYWORD_AUTOMATON.add_word(_keyword, (_index, _keyword, _keyword in SUSPICIOUS_WORDS))
+KEYWORD_AUTOMATON.make_automaton()
+
+# Weight per hit id: keyword ids first, then the SCORED_PATTERNS ids
+# shifted by PATTERN_ID_OFFSET
+PATTERN_ID_OFFSET = len(SCAM_KEYWORDS)
+HIT_WEIGHTS = tuple([KEYWORD_WEIGHT] * len(SCAM_KEYWORDS) + [w for _, _, w in SCORED_PATTERNS])
+
+# Category bit set by each scored pattern
+PATTERN_CATEGORY_BITS = tuple(1 << category for _, category, _ in SCORED_PATTERNS)
+
+def _scan_scored_patterns(text_lower: str) -> Set[int]:
+    """Indexes of the SCORED_PATTERNS that match, using the fused re alternation"""
+    if "http" in text_lower or DIGIT_RE.search(text_lower):
+        combined, pattern_count = COMBINED_RE, len(SCORED_RES)
+    else:
+        combined, pattern_count = COMBINED_TEXT_RE, TEXT_PATTERN_COUNT
+    
+    pattern_hits = set()
+    for match in combined.finditer(text_lower):
+        first = GROUP_INDEX[match.lastgroup]
+        pattern_hits.add(first)
+        # The alternation only reports the first branch matching at a
+        # position; check the later ones there too so none is missed
+        for index in range(first + 1, pattern_count):
+            if index not in pattern_hits and SCORED_RES[index].match(text_lower, match.start()):
+                pattern_hits.add(index)
+    return pattern_hits
+
+def _is_whole_word(text_lower: str, start: int, end: int) -> bool:
+    """Whether text_lower[start:end] is not part of a longer run of letters"""
+    return (
+        (start == 0 or not "a" <= text_lower[start - 1] <= "z")
+        and (end == len(text_lower) or not "a" <= text_lower[end] <= "z")
+    )
+
+def analyze_message(text: str, text_lower: Optional[str] = None) -> Tuple[bool, List[str], float, List[str]]:
     """
-    Advanced scam detection with scoring system
-    Returns: (is_scam, detected_keywords, confidence_score)
+    Scam scoring plus suspicious keyword extraction in one keyword pass
+    Pass text_lower when the caller already has the lowercased text.
+    Returns: (is_scam, detected_keywords, confidence_score, suspicious_keywords)
+    where suspicious_keywords matches extractor.extract_suspicious_keywords
     """
-    text_lower = text.lower()
-    detected_keywords = []
-    score = 0.0
-    
-    # Keyword-based scoring
-    keyword_hits = [k for k in SCAM_KEYWORDS if k in text_lower]
-    detected_keywords.extend(keyword_hits)
-    score += len(keyword_hits) * 0.15
-    
-    # Urgency pattern detection
-    for pattern in URGENCY_PATTERNS:
-        if re.search(pattern, text_lower):
-            score += 0.25
-            detected_keywords.append("urgency_tactic")
+    if len(text) < MIN_SCAM_LENGTH:
+        return False, [], 0.0, []
+    if text_lower is None:
+        text_lower = text.lower()
+    # Keyword hits (each keyword counts once, in SCAM_KEYWORDS order) and the
+    # whole-word suspicious words the extractor would report
+    keyword_hits = set()
+    suspicious_keywords = set()
+    for end, (index, keyword, suspicious) in KEYWORD_AUTOMATON.iter(text_lower):
+        if index is not None:
+            keyword_hits.add(index)
+        if suspicious and _is_whole_word(text_lower, end + 1 - len(keyword), end + 1):
+            suspicious_keywords.add(keyword)
     
-    # Financial threat patterns
-    for pattern in FINANCIAL_PATTERNS:
-        if re.search(pattern, text_lower):
-            score += 0.30
-            detected_keywords.append("financial_threat")
+    # Pattern hits: urgency, financial threats, phishing, links, phone numbers
+    pattern_hits = matching_ids(SCORED_DB, text_lower)
+    if pattern_hits is None:
+        pattern_hits = _scan_scored_patterns(text_lower)
     
-    # Phishing patterns
-    for pattern in PHISHING_PATTERNS:
-        if re.search(pattern, text_lower):
-            score += 0.20
-            detected_keywords.append("phishing_attempt")
+    # Score by table lookup: weights are resolved per hit id and summed by
+    # the builtin, with no per-hit Python arithmetic
+    hit_ids = sorted(keyword_hits) + [PATTERN_ID_OFFSET + index for index in sorted(pattern_hits)]
+    score = sum(map(HIT_WEIGHTS.__getitem__, hit_ids), 0.0)
     
-    # Suspicious URL detection
-    if re.search(r'https?://[^\s]+', text):
-        score += 0.15
-        detected_keywords.append("suspicious_link")
-    
-    # Phone number detection
-    if re.search(r'\+?\d{10,}', text):
-        score += 0.10
-        detected_keywords.append("phone_number")
+    # Every pattern scores, but each category is reported once
+    category_mask = 0
+    for index in pattern_hits:
+        category_mask |= PATTERN_CATEGORY_BITS[index]
+    detected_keywords = [SCAM_KEYWORDS[i] for i in sorted(keyword_hits)]
+    detected_keywords.extend(
+        label for category, label in enumerate(CATEGORY_LABELS) if category_mask & (1 << category)
+    )
     
     # Normalize score to 0-1 range
     confidence_score = min(score, 1.0)
     is_scam = confidence_score >= 0.4  # Threshold for scam detection
     
+    return is_scam, detected_keywords, confidence_score, list(suspicious_keywords)
+
+def calculate_scam_score(text: str, text_lower: Optional[str] = None) -> Tuple[bool, List[str], float]:
+    """
+    Advanced scam detection with scoring system
+    Pass text_lower when the caller already has the lowercased text.
+    Returns: (is_scam, detected_keywords, confidence_score)
+    """
+    is_scam, detected_keywords, confidence_score, _ = analyze_message(text, text_lower)
     return is_scam, detected_keywords, confidence_score
 
 def detect_scam(text: str) -> Tuple[bool, List[str]]:
@@ -1,116 +1,150 @@
 import re
-from typing import Dict, List, Any
+from typing import Dict, List, Any, Optional, Set
+
+from pattern_db import build_database, matching_ids
 
 # Enhanced regex patterns for intelligence extraction
+# Overlapping variants are folded into one pattern (or one alternation) per
+# shape, so each findall pass finds a match only once
 UPI_PATTERNS = [
-    r"[a-zA-Z0-9.\-_]{2,}@[a-zA-Z]{2,}",
-    r"[a-zA-Z0-9.\-_]+@[\w.-]+",
-    r"\b[\w.-]+@[\w.-]+\.[a-zA-Z]{2,}\b"
+    r"[\w.\-]+@[\w\-]+(?:\.[\w\-]+)*"
 ]
 
 PHONE_PATTERNS = [
-    r"\+91[6-9]\d{9}",
-    r"\+?\d{10,15}",
-    r"\b\d{10}\b",
-    r"\+91[-\s]?\d{5}[-\s]?\d{5}"
+    r"\+?\d{10,15}|\+91[-\s]?\d{5}[-\s]?\d{5}"
 ]
 
 URL_PATTERNS = [
-    r"https?://[^\s]+",
-    r"www\.[^\s]+",
-    r"[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}[^\s]*"
+    r"https?://[^\s]+|www\.[^\s]+|[a-zA-Z0-9.-]+\.[a-zA-Z]{2,}[^\s]*"
 ]
 
 BANK_ACCOUNT_PATTERNS = [
-    r"\b\d{10,18}\b",
-    r"\b[A-Z]{4}\d{7,15}\b",
-    r"account\s*#?\s*[:\-]?\s*\d+",
-    r"a/c\s*[:\-]?\s*\d+"
+    r"\b\d{10,18}\b|\b[A-Z]{4}\d{7,15}\b",
+    r"(?:account\s*#?|a/c)\s*[:\-]?\s*\d+"
 ]
 
 CARD_PATTERNS = [
-    r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b",
-    r"\b\d{13,19}\b",
+    r"\b\d{4}[-\s]?\d{4}[-\s]?\d{4}[-\s]?\d{4}\b|\b\d{13,19}\b",
     r"card\s*#?\s*[:\-]?\s*\d+"
 ]
 
-def extract_upi_ids(text: str) -> List[str]:
+# Compiled once at import so extraction never goes through re's pattern cache
+UPI_RES = [re.compile(p, re.IGNORECASE) for p in UPI_PATTERNS]
+PHONE_RES = [re.compile(p) for p in PHONE_PATTERNS]
+URL_RES = [re.compile(p, re.IGNORECASE) for p in URL_PATTERNS]
+BANK_ACCOUNT_RES = [re.compile(p, re.IGNORECASE) for p in BANK_ACCOUNT_PATTERNS]
+CARD_RES = [re.compile(p) for p in CARD_PATTERNS]
+
+SUSPICIOUS_WORDS = frozenset([
+    "urgent", "immediate", "verify", "confirm", "suspended",
+    "blocked", "freeze", "expire", "limited", "exclusive",
+    "prize", "winner", "lottery", "bonus", "reward",
+    "click", "download", "install", "update", "payment",
+    "required", "deposit", "transfer", "otp", "cvv", "pin"
+])
+
+WORD_RE = re.compile(r"[a-z]+")
+
+# One Hyperscan database over every extractor pattern, used as a prefilter so
+# findall only runs for patterns that actually occur in the text
+EXTRACTION_RES = UPI_RES + PHONE_RES + URL_RES + BANK_ACCOUNT_RES + CARD_RES
+EXTRACTION_DB = build_database(EXTRACTION_RES)
+
+def find_matching_patterns(text: str) -> Optional[Set[re.Pattern]]:
+    """
+    Extractor patterns that occur in text, from a single Hyperscan scan.
+    Returns None when hyperscan is unavailable (every pattern is a candidate).
+    """
+    ids = matching_ids(EXTRACTION_DB, text)
+    if ids is None:
+        return None
+    return {EXTRACTION_RES[i] for i in ids}
+
+def _candidates(patterns: List[re.Pattern], hits: Optional[Set[re.Pattern]]) -> List[re.Pattern]:
+    """Patterns worth running findall for, given a prefilter result"""
+    if hits is None:
+        return patterns
+    return [pattern for pattern in patterns if pattern in hits]
+
+def _unique_matches(patterns: List[re.Pattern], text: str) -> List[str]:
+    """Distinct matched strings of all patterns, without building match lists"""
+    found = set()
+    for pattern in patterns:
+        for match in pattern.finditer(text):
+            found.add(match.group())
+    return list(found)
+
+def extract_upi_ids(text: str, hits: Optional[Set[re.Pattern]] = None) -> List[str]:
     """Extract UPI IDs from text"""
-    upi_ids = []
-    for pattern in UPI_PATTERNS:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        upi_ids.extend(matches)
-    return list(set(upi_ids))  # Remove duplicates
+    return _unique_matches(_candidates(UPI_RES, hits), text)
 
-def extract_phone_numbers(text: str) -> List[str]:
+def extract_phone_numbers(text: str, hits: Optional[Set[re.Pattern]] = None) -> List[str]:
     """Extract phone numbers from text"""
-    phone_numbers = []
-    for pattern in PHONE_PATTERNS:
-        matches = re.findall(pattern, text)
-        phone_numbers.extend(matches)
-    return list(set(phone_numbers))
+    return _unique_matches(_candidates(PHONE_RES, hits), text)
 
-def extract_urls(text: str) -> List[str]:
+def extract_urls(text: str, hits: Optional[Set[re.Pattern]] = None) -> List[str]:
     """Extract URLs from text"""
-    urls = []
-    for pattern in URL_PATTERNS:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        urls.extend(matches)
-    return list(set(urls))
+    return _unique_matches(_candidates(URL_RES, hits), text)
 
-def extract_bank_accounts(text: str) -> List[str]:
+def extract_bank_accounts(text: str, hits: Optional[Set[re.Pattern]] = None) -> List[str]:
     """Extract bank account numbers from text"""
-    accounts = []
-    for pattern in BANK_ACCOUNT_PATTERNS:
-        matches = re.findall(pattern, text, re.IGNORECASE)
-        accounts.extend(matches)
-    return list(set(accounts))
+    return _unique_matches(_candidates(BANK_ACCOUNT_RES, hits), text)
 
-def extract_card_numbers(text: str) -> List[str]:
+def extract_card_numbers(text: str, hits: Optional[Set[re.Pattern]] = None) -> List[str]:
     """Extract card numbers from text"""
-    cards = []
-    for pattern in CARD_PATTERNS:
-        matches = re.findall(pattern, text)
-        cards.extend(matches)
-    return list(set(cards))
-
-def extract_suspicious_keywords(text: str) -> List[str]:
-    """Extract suspicious keywords from text"""
-    suspicious_words = [
-        "urgent", "immediate", "verify", "confirm", "suspended",
-        "blocked", "freeze", "expire", "limited", "exclusive",
-        "prize", "winner", "lottery", "bonus", "reward",
-        "click", "download", "install", "update", "payment",
-        "required", "deposit", "transfer", "otp", "cvv", "pin"
-    ]
-    
-    found_keywords = []
-    text_lower = text.lower()
-    
-    for word in suspicious_words:
-        if word in text_lower:
-            found_keywords.append(word)
-    
-    return list(set(found_keywords))
+    return _unique_matches(_candidates(CARD_RES, hits), text)
+
+def extract_suspicious_keywords(text: str, text_lower: Optional[str] = None) -> List[str]:
+    """Extract suspicious keywords (whole words) from text"""
+    if text_lower is None:
+        text_lower = text.lower()
+    tokens = set(WORD_RE.findall(text_lower))
+    return list(tokens & SUSPICIOUS_WORDS)
+
+def merge_unique(existing: List[str], new_items: List[str], seen: Optional[Set[str]] = None) -> None:
+    """
+    Append the new items missing from existing, keeping first-seen order.
+    seen is the set of items already in existing; pass one that persists
+    alongside the list to avoid rebuilding it on every merge.
+    """
+    if seen is None:
+        seen = set(existing)
+    for item in new_items:
+        if item not in seen:
+            seen.add(item)
+            existing.append(item)
 
-def extract_intelligence(text: str, existing_intel: Dict[str, List[str]]) -> Dict[str, List[str]]:
+def extract_intelligence(text: str, existing_intel: Dict[str, List[str]],
+                         text_lower: Optional[str] = None,
+                         suspicious_keywords: Optional[List[str]] = None,
+                         seen: Optional[Dict[str, Set[str]]] = None) -> Dict[str, List[str]]:
     """
     Comprehensive intelligence extraction from text
+    Pass text_lower when the caller already has the lowercased text, and
+    suspicious_keywords when detector.analyze_message already found them.
+    seen maps each intelligence key to the set of items already in its list.
     """
     # Extract all types of intelligence
-    upi_ids = extract_upi_ids(text)
-    phone_numbers = extract_phone_numbers(text)
-    urls = extract_urls(text)
-    bank_accounts = extract_bank_accounts(text)
-    card_numbers = extract_card_numbers(text)
-    suspicious_keywords = extract_suspicious_keywords(text)
+    hits = find_matching_patterns(text)
+    upi_ids = extract_upi_ids(text, hits)
+    phone_numbers = extract_phone_numbers(text, hits)
+    urls = extract_urls(text, hits)
+    bank_accounts = extract_bank_accounts(text, hits)
+    card_numbers = extract_card_numbers(text, hits)
+    if suspicious_keywords is None:
+        suspicious_keywords = extract_suspicious_keywords(text, text_lower)
     
     # Update existing intelligence without duplicates
-    existing_intel["upiIds"].extend([uid for uid in upi_ids if uid not in existing_intel["upiIds"]])
-    existing_intel["phoneNumbers"].extend([pn for pn in phone_numbers if pn not in existing_intel["phoneNumbers"]])
-    existing_intel["phishingLinks"].extend([url for url in urls if url not in existing_intel["phishingLinks"]])
-    existing_intel["bankAccounts"].extend([ba for ba in bank_accounts if ba not in existing_intel["bankAccounts"]])
-    existing_intel["suspiciousKeywords"].extend([kw for kw in suspicious_keywords if kw not in existing_intel["suspiciousKeywords"]])
+    if seen is None:
+        seen = {}
+    for key, items in (
+        ("upiIds", upi_ids),
+        ("phoneNumbers", phone_numbers),
+        ("phishingLinks", urls),
+        ("bankAccounts", bank_accounts),
+        ("suspiciousKeywords", suspicious_keywords)
+    ):
+        merge_unique(existing_intel[key], items, seen.get(key))
     
     return existing_intel
 
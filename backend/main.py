@@ -1,17 +1,20 @@
-from fastapi import FastAPI, Header, HTTPException, Request
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.responses import JSONResponse
-import requests
+import httpx
+import orjson
+import asyncio
+import hmac
 import logging
-import json
 import time
+from contextlib import asynccontextmanager
 from typing import Dict, Any, Optional
 from pydantic import BaseModel, Field
 
-from detector import calculate_scam_score, detect_scam
-from extractor import extract_intelligence
-from agent import agent_reply
-from session_store import get_session, update_session, get_session_summary, mark_completed
-from config import API_KEY, GUVI_CALLBACK
+from detector import analyze_message
+from extractor import extract_intelligence, merge_unique
+from agent import agent_reply, message_lower
+from session_store import SessionBackend, session_manager
+from config import API_KEY, GUVI_CALLBACK, REDIS_URL, SESSION_BACKEND
 
 # Configure logging
 logging.basicConfig(
@@ -20,10 +23,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Session backend: the in-process manager, or Redis when SESSION_BACKEND=redis
+sessions: SessionBackend = session_manager
+if SESSION_BACKEND == "redis":
+    from redis_store import RedisSessionManager
+    sessions = RedisSessionManager(REDIS_URL)
+
+# Seconds allowed for a callback request, and for pending callbacks at shutdown
+CALLBACK_TIMEOUT = 10.0
+
+# Shared async HTTP client for the evaluation callback (created on first use)
+http_client: Optional[httpx.AsyncClient] = None
+
+# Strong references to fire-and-forget callback tasks until they finish
+background_tasks = set()
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared callback client, creating it if needed"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=CALLBACK_TIMEOUT,
+            headers={"Content-Type": "application/json"}
+        )
+    return http_client
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Open the callback client and start session expiry on startup; stop both on shutdown"""
+    get_http_client()
+    expiry_task = asyncio.create_task(sessions.expiry_loop())
+    yield
+    expiry_task.cancel()
+    # Let callbacks still in flight finish before their client is closed
+    if background_tasks:
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(*background_tasks, return_exceptions=True),
+                timeout=CALLBACK_TIMEOUT
+            )
+        except asyncio.TimeoutError:
+            logger.warning("Shutting down with %d callbacks still pending", len(background_tasks))
+    await sessions.close()
+    if http_client is not None:
+        await http_client.aclose()
+
 app = FastAPI(
     title="Agentic Honeypot API",
     description="AI-powered scam detection and intelligence extraction system",
-    version="2.0.0"
+    version="2.0.0",
+    lifespan=lifespan
 )
 
 # Pydantic models for request validation
@@ -49,6 +98,19 @@ class HoneypotResponse(BaseModel):
     scamDetected: Optional[bool] = Field(None, description="Whether scam was detected")
     confidence: Optional[float] = Field(None, description="Scam detection confidence")
 
+class StatsResponse(BaseModel):
+    totalSessions: int = Field(..., description="Sessions currently held")
+    activeSessions: int = Field(..., description="Sessions not yet completed")
+    scamSessions: int = Field(..., description="Sessions with a detected scam")
+    detectionRate: float = Field(..., description="Percentage of sessions with a detected scam")
+    timestamp: int = Field(..., description="Epoch timestamp in milliseconds")
+
+def require_api_key(x_api_key: Optional[str] = Header(None, description="API key for authentication")) -> None:
+    """Shared authentication dependency using a constant-time key comparison"""
+    if not hmac.compare_digest((x_api_key or "").encode(), API_KEY.encode()):
+        logger.warning("Invalid API key attempt: %s", x_api_key)
+        raise HTTPException(status_code=401, detail="Invalid API key")
+
 @app.get("/")
 async def root():
     """Root endpoint - returns API info"""
@@ -66,7 +128,7 @@ async def root():
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
     """Global exception handler for better error responses"""
-    logger.error(f"Unhandled exception: {str(exc)}", exc_info=True)
+    logger.error("Unhandled exception: %s", exc, exc_info=True)
     return JSONResponse(
         status_code=500,
         content={
@@ -77,99 +139,109 @@ async def global_exception_handler(request: Request, exc: Exception):
     )
 
 
-@app.post("/honeypot/message", response_model=HoneypotResponse)
-async def honeypot_message(
-    request: HoneypotRequest,
-    x_api_key: str = Header(None, description="API key for authentication")
-):
+@app.post("/honeypot/message", response_model=HoneypotResponse, dependencies=[Depends(require_api_key)])
+async def honeypot_message(request: HoneypotRequest):
     """
     Main honeypot endpoint for processing scam messages
     Handles conversation history and multi-turn conversations
     """
-    # Authentication
-    if x_api_key != API_KEY:
-        logger.warning(f"Invalid API key attempt: {x_api_key}")
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
     try:
+        # One clock read per request, reused for every timestamp we create
+        now_ms = int(time.time() * 1000)
         session_id = request.sessionId
-        message = request.message.dict()
-        text = message["text"]
+        text = request.message.text
+        message = {
+            "sender": request.message.sender,
+            "text": text,
+            "timestamp": request.message.timestamp
+        }
+        # Lowercase once; detector and extractor both reuse it
+        text_lower = message_lower(message)
         conversation_history = request.conversationHistory or []
         
-        logger.info(f"Processing message for session {session_id}: {text[:100]}...")
-        
-        # Get or create session
-        session = get_session(session_id)
-        
-        # Build complete message history from conversationHistory + current message
-        complete_history = conversation_history.copy()
-        complete_history.append(message)
+        logger.info("Processing message for session %s: %.100s...", session_id, text)
         
-        # Update session with complete conversation history
-        session["conversationHistory"] = complete_history
-        session["messages"] = complete_history
-        
-        # Perform scam detection with confidence scoring
-        is_scam, keywords, confidence = calculate_scam_score(text)
-        
-        # Update session with message and analysis
-        update_session(session_id, message, is_scam, confidence)
-        
-        if is_scam:
-            logger.info(f"Scam detected in session {session_id} with confidence {confidence:.2f}")
+        # One request per session at a time; the session is loaded, updated
+        # in place and saved back as a whole
+        async with sessions.session_lock(session_id):
+            # Get or create session
+            session = await sessions.load_session(session_id)
             
-            # Extract intelligence from the message
-            session["intelligence"] = extract_intelligence(text, session["intelligence"])
-            
-            # Add detected keywords to intelligence
-            session["intelligence"]["suspiciousKeywords"].extend(
-                [kw for kw in keywords if kw not in session["intelligence"]["suspiciousKeywords"]]
-            )
+            # The session keeps its own bounded history; the client's copy is only
+            # needed to seed a session we have not seen before (e.g. after a restart)
+            if not session.messages:
+                for previous_message in conversation_history:
+                    sessions.record_message(session, {
+                        "sender": previous_message.get("sender", "unknown"),
+                        "text": previous_message.get("text", ""),
+                        "timestamp": previous_message.get("timestamp", now_ms)
+                    })
             
-            # Generate agent response based on complete conversation history
-            reply = agent_reply(complete_history)
+            # Perform scam detection with confidence scoring
+            is_scam, keywords, confidence, suspicious_keywords = analyze_message(text, text_lower)
             
-            # Add agent reply to conversation history
-            agent_message = {
-                "sender": "user",
-                "text": reply,
-                "timestamp": int(time.time() * 1000)
-            }
-            session["messages"].append(agent_message)
-            session["conversationHistory"].append(agent_message)
+            # Update session with message and analysis
+            sessions.record_message(session, message, is_scam, confidence)
             
-            # Check if we should send final callback
-            # Send after sufficient engagement (8+ messages) or high confidence
-            should_callback = (
-                len(session["messages"]) >= 8 or 
-                (confidence >= 0.8 and len(session["messages"]) >= 4)
-            ) and not session["completed"]
+            reply = "Okay."
+            should_callback = False
+            if is_scam:
+                logger.info("Scam detected in session %s with confidence %.2f", session_id, confidence)
+                
+                # Extract intelligence from the message
+                seen = session.intelligence_seen
+                session.intelligence = extract_intelligence(
+                    text, session.intelligence, text_lower, suspicious_keywords, seen
+                )
+                
+                # Add detected keywords to intelligence
+                merge_unique(
+                    session.intelligence["suspiciousKeywords"], keywords, seen["suspiciousKeywords"]
+                )
+                
+                # Generate agent response based on the session's recent history
+                reply = agent_reply(session.messages)
+                
+                # Add agent reply to conversation history
+                agent_message = {
+                    "sender": "user",
+                    "text": reply,
+                    "timestamp": now_ms
+                }
+                sessions.record_message(session, agent_message)
+                
+                # Check if we should send final callback
+                # Send after sufficient engagement (8+ messages) or high confidence
+                total_messages = session.total_messages_exchanged
+                should_callback = (
+                    total_messages >= 8 or 
+                    (confidence >= 0.8 and total_messages >= 4)
+                ) and not session.completed
+                
+                if should_callback:
+                    sessions.complete_session(session)
+            else:
+                # No scam detected - minimal response
+                logger.info("No scam detected in session %s", session_id)
             
-            if should_callback:
-                logger.info(f"Sending final callback for session {session_id}")
-                await send_final_callback(session_id)
-                mark_completed(session_id)
-            
-            return HoneypotResponse(
-                status="success",
-                reply=reply,
-                scamDetected=True,
-                confidence=confidence
-            )
+            await sessions.save_session(session)
         
-        else:
-            # No scam detected - minimal response
-            logger.info(f"No scam detected in session {session_id}")
-            return HoneypotResponse(
-                status="success",
-                reply="Okay.",
-                scamDetected=False,
-                confidence=confidence
-            )
+        if should_callback:
+            logger.info("Sending final callback for session %s", session_id)
+            # Fire and forget: the reply must not wait on the evaluation endpoint
+            task = asyncio.create_task(send_final_callback(session_id))
+            background_tasks.add(task)
+            task.add_done_callback(background_tasks.discard)
+        
+        return HoneypotResponse(
+            status="success",
+            reply=reply,
+            scamDetected=is_scam,
+            confidence=confidence
+        )
     
     except Exception as e:
-        logger.error(f"Error processing message for session {session_id}: {str(e)}", exc_info=True)
+        logger.error("Error processing message for session %s: %s", session_id, e, exc_info=True)
         raise HTTPException(status_code=500, detail="Internal processing error")
 
 async def send_final_callback(session_id: str):
@@ -177,7 +249,7 @@ async def send_final_callback(session_id: str):
     Send final results to GUVI evaluation endpoint
     """
     try:
-        session_summary = get_session_summary(session_id)
+        session_summary = await sessions.load_session_summary(session_id)
         
         callback_payload = {
             "sessionId": session_id,
@@ -187,48 +259,31 @@ async def send_final_callback(session_id: str):
             "agentNotes": session_summary["agentNotes"]
         }
         
-        logger.info(f"Sending callback payload: {json.dumps(callback_payload, indent=2)}")
+        logger.debug("Sending callback payload: %s", callback_payload)
         
-        response = requests.post(
-            GUVI_CALLBACK,
-            json=callback_payload,
-            timeout=10,
-            headers={"Content-Type": "application/json"}
-        )
+        response = await get_http_client().post(GUVI_CALLBACK, content=orjson.dumps(callback_payload))
         
         if response.status_code == 200:
-            logger.info(f"Successfully sent callback for session {session_id}")
+            logger.info("Successfully sent callback for session %s", session_id)
         else:
-            logger.error(f"Failed to send callback for session {session_id}: {response.status_code} - {response.text}")
+            logger.error(
+                "Failed to send callback for session %s: %s - %s",
+                session_id, response.status_code, response.text
+            )
     
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Network error sending callback for session {session_id}: {str(e)}")
+    except httpx.HTTPError as e:
+        logger.error("Network error sending callback for session %s: %s", session_id, e)
     except Exception as e:
-        logger.error(f"Unexpected error sending callback for session {session_id}: {str(e)}")
+        logger.error("Unexpected error sending callback for session %s: %s", session_id, e)
 
-@app.get("/stats")
-async def get_stats(x_api_key: str = Header(None)):
+@app.get("/stats", response_model=StatsResponse, dependencies=[Depends(require_api_key)])
+async def get_stats():
     """Get system statistics (authenticated endpoint)"""
-    if x_api_key != API_KEY:
-        raise HTTPException(status_code=401, detail="Invalid API key")
-    
-    from session_store import session_manager
-    
-    total_sessions = len(session_manager.sessions)
-    active_sessions = len([
-        s for s in session_manager.sessions.values() 
-        if not s["completed"]
-    ])
-    scam_sessions = len([
-        s for s in session_manager.sessions.values() 
-        if s["scamDetected"]
-    ])
+    stats = await sessions.load_stats()
     
     return {
-        "totalSessions": total_sessions,
-        "activeSessions": active_sessions,
-        "scamSessions": scam_sessions,
-        "detectionRate": scam_sessions / max(total_sessions, 1) * 100,
+        **stats,
+        "detectionRate": stats["scamSessions"] / max(stats["totalSessions"], 1) * 100,
         "timestamp": int(time.time() * 1000)
     }
 
@@ -0,0 +1,54 @@
+import re
+from typing import Any, List, Optional, Set
+
+# Hyperscan is optional: without it callers fall back to their compiled re patterns
+try:
+    import hyperscan
+except ImportError:
+    hyperscan = None
+
+def build_database(patterns: List[re.Pattern]) -> Optional[Any]:
+    """
+    Compile a list of re patterns into one Hyperscan block-mode database.
+    Pattern ids are list positions. Returns None when Hyperscan is unavailable
+    or rejects one of the patterns.
+    """
+    if hyperscan is None:
+        return None
+
+    flags = []
+    for pattern in patterns:
+        pattern_flags = hyperscan.HS_FLAG_SINGLEMATCH
+        if pattern.flags & re.IGNORECASE:
+            pattern_flags |= hyperscan.HS_FLAG_CASELESS
+        flags.append(pattern_flags)
+
+    database = hyperscan.Database()
+    try:
+        database.compile(
+            expressions=[pattern.pattern.encode("ascii") for pattern in patterns],
+            ids=list(range(len(patterns))),
+            elements=len(patterns),
+            flags=flags
+        )
+    except hyperscan.error:
+        return None
+    return database
+
+def matching_ids(database: Optional[Any], text: str) -> Optional[Set[int]]:
+    """
+    Ids of the patterns that match anywhere in text, found in a single scan.
+    Returns None when the caller should use its re patterns instead.
+    """
+    # Hyperscan's \b, \w and \d are ASCII-only while re's are Unicode-aware,
+    # so only pure ASCII text is guaranteed to give the same answer
+    if database is None or not text.isascii():
+        return None
+
+    hits = set()
+
+    def on_match(pattern_id: int, start: int, end: int, flags: int, context: Any) -> None:
+        hits.add(pattern_id)
+
+    database.scan(text.encode("ascii"), match_event_handler=on_match)
+    return hits
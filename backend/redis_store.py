@@ -0,0 +1,170 @@
+import asyncio
+import logging
+import time
+import weakref
+
+import orjson
+import redis.asyncio as redis
+from redis.exceptions import LockNotOwnedError
+
+from session_store import (
+    HISTORY_LIMIT, Session, SessionBackend, SessionStats, SessionSummary, stored_message
+)
+
+# Session attributes stored as JSON-encoded fields of the session hash
+HASH_FIELDS = (
+    "scam_detected", "scam_confidence", "intelligence", "agent_persona",
+    "conversation_stage", "start_time", "completed", "total_messages_exchanged",
+    "scammer_messages_count", "agent_messages_count", "engagement_score",
+    "extracted_patterns", "risk_level"
+)
+
+# Sorted sets of session ids scored by last activity, backing the stats
+ALL_SESSIONS_KEY = "sessions:all"
+COMPLETED_SESSIONS_KEY = "sessions:completed"
+SCAM_SESSIONS_KEY = "sessions:scam"
+STATS_KEYS = (ALL_SESSIONS_KEY, COMPLETED_SESSIONS_KEY, SCAM_SESSIONS_KEY)
+
+# Seconds a worker may hold a session lock before Redis releases it, and
+# the longest a request waits to acquire one
+LOCK_TIMEOUT = 10.0
+
+# Seconds between attempts to take a session lock held by another worker
+LOCK_POLL_INTERVAL = 0.01
+
+logger = logging.getLogger(__name__)
+
+def _session_key(session_id: str) -> str:
+    return f"session:{session_id}"
+
+def _messages_key(session_id: str) -> str:
+    return f"session:{session_id}:messages"
+
+def _lock_key(session_id: str) -> str:
+    return f"session:{session_id}:lock"
+
+class SessionLock:
+    """
+    Lock on one session across every worker: the process-local lock queues
+    requests within this worker, then the Redis lock (SET NX PX) excludes
+    the other workers
+    """
+    __slots__ = ("session_id", "local", "shared")
+    
+    def __init__(self, session_id: str, local: asyncio.Lock, shared):
+        self.session_id = session_id
+        self.local = local
+        self.shared = shared
+    
+    async def __aenter__(self):
+        await self.local.acquire()
+        try:
+            await self.shared.acquire()
+        except BaseException:
+            self.local.release()
+            raise
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        try:
+            await self.shared.release()
+        except LockNotOwnedError:
+            logger.warning("Session lock for %s expired before release", self.session_id)
+        finally:
+            self.local.release()
+        return False
+
+class RedisSessionManager(SessionBackend):
+    """
+    Sessions kept in Redis, so they survive restarts and are shared by every
+    worker. Each session is a hash of its fields plus a list of its recent
+    messages; Redis expires both after session_timeout without activity.
+    Session locks are held in Redis, so a session is loaded, updated and
+    saved by one worker at a time.
+    """
+
+    def __init__(self, url: str):
+        super().__init__()
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        # Sessions are never evicted locally, so locks live only while in use
+        self._locks = weakref.WeakValueDictionary()
+    
+    def session_lock(self, session_id: str) -> SessionLock:
+        """Lock serializing work on one session across every worker"""
+        shared = self.redis.lock(
+            _lock_key(session_id), timeout=LOCK_TIMEOUT,
+            sleep=LOCK_POLL_INTERVAL, blocking_timeout=LOCK_TIMEOUT
+        )
+        return SessionLock(session_id, super().session_lock(session_id), shared)
+
+    async def load_session(self, session_id: str) -> Session:
+        """Get a session from Redis, or a new one if it does not exist or expired"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(_session_key(session_id))
+            pipe.lrange(_messages_key(session_id), 0, -1)
+            fields, messages = await pipe.execute()
+
+        current_time = time.time()
+        session = Session(session_id, current_time)
+        for name, value in fields.items():
+            setattr(session, name, orjson.loads(value))
+        session.intelligence_seen = {key: set(items) for key, items in session.intelligence.items()}
+        session.messages.extend(orjson.loads(message) for message in messages)
+        session.stored_messages = session.total_messages_exchanged
+        return session
+
+    async def save_session(self, session: Session) -> None:
+        """Write the session back in one round trip and refresh its expiry"""
+        session_key = _session_key(session.session_id)
+        messages_key = _messages_key(session.session_id)
+        # Only the messages recorded since the session was loaded are pushed
+        new_count = min(session.total_messages_exchanged - session.stored_messages, len(session.messages))
+        new_messages = [
+            orjson.dumps(stored_message(session.messages[i]))
+            for i in range(len(session.messages) - new_count, len(session.messages))
+        ]
+        cutoff = time.time() - self.session_timeout
+
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.hset(session_key, mapping={name: orjson.dumps(getattr(session, name)) for name in HASH_FIELDS})
+            if new_messages:
+                pipe.rpush(messages_key, *new_messages)
+                pipe.ltrim(messages_key, -HISTORY_LIMIT, -1)
+            pipe.expire(session_key, self.session_timeout)
+            pipe.expire(messages_key, self.session_timeout)
+
+            score = {session.session_id: session.last_activity}
+            pipe.zadd(ALL_SESSIONS_KEY, score)
+            if session.completed:
+                pipe.zadd(COMPLETED_SESSIONS_KEY, score)
+            if session.scam_detected:
+                pipe.zadd(SCAM_SESSIONS_KEY, score)
+            # Drop ids of expired sessions so the stats sets stay bounded
+            for key in STATS_KEYS:
+                pipe.zremrangebyscore(key, "-inf", cutoff)
+            await pipe.execute()
+        session.stored_messages = session.total_messages_exchanged
+
+    async def load_session_summary(self, session_id: str) -> SessionSummary:
+        """Summary of the stored session for the final callback"""
+        return self.session_summary(await self.load_session(session_id))
+
+    async def load_stats(self) -> SessionStats:
+        """Session counts over sessions active within session_timeout"""
+        cutoff = time.time() - self.session_timeout
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for key in STATS_KEYS:
+                pipe.zremrangebyscore(key, "-inf", cutoff)
+                pipe.zcard(key)
+            results = await pipe.execute()
+
+        total, completed, scam = results[1::2]
+        return {
+            "totalSessions": total,
+            "activeSessions": total - completed,
+            "scamSessions": scam
+        }
+
+    async def close(self) -> None:
+        """Close the Redis connection pool"""
+        await self.redis.aclose()
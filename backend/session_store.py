@@ -1,169 +1,403 @@
+import asyncio
 import json
+from abc import ABC, abstractmethod
+from bisect import bisect_right
 import time
-from typing import Dict, Any, List
+from collections import OrderedDict, deque
+from typing import Dict, Any, List, Optional, Set, TypedDict
 from datetime import datetime, timedelta
 
-class SessionManager:
+# numba is optional: with it the engagement arithmetic is compiled to native code
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Number of recent messages kept in a session
+HISTORY_LIMIT = 200
+
+# Risk level per confidence band: RISK_LEVELS[i] covers confidences from
+# RISK_THRESHOLDS[i - 1] (inclusive) up to RISK_THRESHOLDS[i]
+RISK_THRESHOLDS = (0.4, 0.6, 0.8)
+RISK_LEVELS = ("very_low", "low", "medium", "high")
+
+# Seconds between background sweeps of expired sessions
+CLEANUP_INTERVAL = 60
+
+# Most sessions held at once; the least recently used are evicted beyond it
+MAX_SESSIONS = 10_000
+
+def engagement_score(total: int, scammer_messages: int, intelligence_kinds: int) -> float:
+    """Engagement score from message counts and the number of non-empty intelligence lists"""
+    base_score = min(total * 0.1, 1.0)
+    scammer_ratio = scammer_messages / max(total, 1)
+    intelligence_score = min(intelligence_kinds * 0.2, 1.0)
+    return (base_score + scammer_ratio + intelligence_score) / 3
+
+if njit is not None:
+    engagement_score = njit(cache=True)(engagement_score)
+    # Compile at import rather than on the first message
+    engagement_score(1, 1, 1)
+
+def stored_message(message: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of a message worth keeping, without the agent's cached lowercase text and tokens"""
+    return {
+        "sender": message.get("sender", "unknown"),
+        "text": message.get("text", ""),
+        "timestamp": message["timestamp"]
+    }
+
+class SessionSummary(TypedDict):
+    """Summary of a session, as sent in the final callback"""
+    sessionId: str
+    scamDetected: bool
+    totalMessagesExchanged: int
+    scamConfidence: float
+    riskLevel: str
+    engagementScore: float
+    extractedIntelligence: Dict[str, List[str]]
+    conversationDuration: float
+    agentNotes: str
+
+class SessionStats(TypedDict):
+    """Session counts reported by /stats"""
+    totalSessions: int
+    activeSessions: int
+    scamSessions: int
+
+class Session:
+    """State of one honeypot conversation"""
+    
+    __slots__ = (
+        "session_id", "scam_detected", "scam_confidence", "messages",
+        "intelligence", "intelligence_seen",
+        "agent_persona", "conversation_stage", "start_time", "last_activity",
+        "completed", "total_messages_exchanged", "scammer_messages_count",
+        "agent_messages_count", "engagement_score", "extracted_patterns",
+        "risk_level", "agent_notes", "stored_messages"
+    )
+    
+    def __init__(self, session_id: str, current_time: float):
+        self.session_id = session_id
+        self.scam_detected = False
+        self.scam_confidence = 0.0
+        # The one copy of the recent conversation, as the stored message dicts
+        self.messages: deque = deque(maxlen=HISTORY_LIMIT)
+        # Plain lists keyed like the callback payload, which serializes them as-is
+        self.intelligence: Dict[str, List[str]] = {
+            "bankAccounts": [],
+            "upiIds": [],
+            "phishingLinks": [],
+            "phoneNumbers": [],
+            "suspiciousKeywords": []
+        }
+        # Items already in each intelligence list, for O(1) dedup
+        self.intelligence_seen: Dict[str, Set[str]] = {
+            "bankAccounts": set(),
+            "upiIds": set(),
+            "phishingLinks": set(),
+            "phoneNumbers": set(),
+            "suspiciousKeywords": set()
+        }
+        self.agent_persona: Optional[str] = None
+        self.conversation_stage = 0
+        self.start_time = current_time
+        self.last_activity = current_time
+        self.completed = False
+        self.total_messages_exchanged = 0
+        self.scammer_messages_count = 0
+        self.agent_messages_count = 0
+        self.engagement_score = 0.0
+        self.extracted_patterns: List[str] = []
+        self.risk_level = "low"
+        # Cached agent notes; None when they must be regenerated. Cleared by
+        # every recorded message, which in the endpoint also follows any
+        # change to the intelligence lists
+        self.agent_notes: Optional[str] = None
+        # How many of the messages exchanged a persistent backend already
+        # holds, so a save only writes the newer ones
+        self.stored_messages = 0
+    
+    def as_dict(self) -> Dict[str, Any]:
+        """JSON-ready view of the session, with the API's camelCase keys"""
+        history = [stored_message(message) for message in self.messages]
+        return {
+            "sessionId": self.session_id,
+            "scamDetected": self.scam_detected,
+            "scamConfidence": self.scam_confidence,
+            "messages": history,
+            "conversationHistory": history,
+            "intelligence": self.intelligence,
+            "agentPersona": self.agent_persona,
+            "conversationStage": self.conversation_stage,
+            "startTime": self.start_time,
+            "lastActivity": self.last_activity,
+            "completed": self.completed,
+            "totalMessagesExchanged": self.total_messages_exchanged,
+            "scammerMessagesCount": self.scammer_messages_count,
+            "agentMessagesCount": self.agent_messages_count,
+            "engagementScore": self.engagement_score,
+            "extractedPatterns": self.extracted_patterns,
+            "riskLevel": self.risk_level
+        }
+
+class SessionBackend(ABC):
+    """
+    Session logic shared by every storage backend: recording messages,
+    scoring, summaries and per-session locks. Backends implement loading,
+    saving and stats.
+    """
+    __slots__ = ("session_timeout", "_locks")
+    
     def __init__(self):
-        self.sessions: Dict[str, Dict[str, Any]] = {}
         self.session_timeout = 3600  # 1 hour in seconds
-        
-    def get_session(self, session_id: str) -> Dict[str, Any]:
-        """
-        Get or create a session with enhanced tracking
-        """
-        current_time = time.time()
-        
-        # Clean up expired sessions
-        self._cleanup_expired_sessions(current_time)
-        
-        if session_id not in self.sessions:
-            self.sessions[session_id] = {
-                "sessionId": session_id,
-                "scamDetected": False,
-                "scamConfidence": 0.0,
-                "messages": [],
-                "conversationHistory": [],
-                "intelligence": {
-                    "bankAccounts": [],
-                    "upiIds": [],
-                    "phishingLinks": [],
-                    "phoneNumbers": [],
-                    "suspiciousKeywords": []
-                },
-                "agentPersona": None,
-                "conversationStage": 0,
-                "startTime": current_time,
-                "lastActivity": current_time,
-                "completed": False,
-                "totalMessagesExchanged": 0,
-                "scammerMessagesCount": 0,
-                "agentMessagesCount": 0,
-                "engagementScore": 0.0,
-                "extractedPatterns": [],
-                "riskLevel": "low"
-            }
-        
-        # Update last activity
-        self.sessions[session_id]["lastActivity"] = current_time
-        
-        return self.sessions[session_id]
+        # Per-session locks for async updates, created on first use
+        self._locks: Dict[str, asyncio.Lock] = {}
     
-    def update_session(self, session_id: str, message: Dict[str, Any], 
-                      scam_detected: bool = False, confidence: float = 0.0) -> None:
-        """
-        Update session with new message and analysis
-        """
-        session = self.get_session(session_id)
-        
-        # Add message to history
-        session["messages"].append(message)
-        session["conversationHistory"].append({
-            "sender": message.get("sender", "unknown"),
-            "text": message.get("text", ""),
-            "timestamp": message.get("timestamp", time.time() * 1000)
-        })
+    def record_message(self, session: Session, message: Dict[str, Any],
+                       scam_detected: bool = False, confidence: float = 0.0) -> None:
+        """Add a message and its analysis to an already loaded session"""
+        # Add message to history, stamping it with the time the session was
+        # loaded if the sender gave none
+        if message.get("timestamp") is None:
+            message["timestamp"] = int(session.last_activity * 1000)
+        session.messages.append(message)
+        session.agent_notes = None
         
         # Update counters
-        session["totalMessagesExchanged"] = len(session["messages"])
-        if message.get("sender") == "scammer":
-            session["scammerMessagesCount"] += 1
-        elif message.get("sender") == "user":
-            session["agentMessagesCount"] += 1
+        total = session.total_messages_exchanged = session.total_messages_exchanged + 1
+        sender = message.get("sender")
+        if sender == "scammer":
+            session.scammer_messages_count += 1
+        elif sender == "user":
+            session.agent_messages_count += 1
         
         # Update scam detection status
         if scam_detected:
-            session["scamDetected"] = True
-            session["scamConfidence"] = max(session["scamConfidence"], confidence)
-            session["riskLevel"] = self._calculate_risk_level(confidence)
+            session.scam_detected = True
+            session.scam_confidence = max(session.scam_confidence, confidence)
+            session.risk_level = self._calculate_risk_level(confidence)
         
         # Update conversation stage
-        session["conversationStage"] = min(session["totalMessagesExchanged"] // 2, 5)
+        session.conversation_stage = min(total // 2, 5)
         
         # Calculate engagement score
-        session["engagementScore"] = self._calculate_engagement_score(session)
+        session.engagement_score = self._calculate_engagement_score(session, total)
+    
+    def complete_session(self, session: Session) -> None:
+        """Mark an already loaded session as completed"""
+        session.completed = True
+    
+    def session_lock(self, session_id: str) -> asyncio.Lock:
+        """Lock serializing async work on one session, created on first use"""
+        lock = self._locks.get(session_id)
+        if lock is None:
+            lock = self._locks[session_id] = asyncio.Lock()
+        return lock
+    
+    @abstractmethod
+    async def load_session(self, session_id: str) -> Session:
+        """Get or create a session"""
+    
+    @abstractmethod
+    async def save_session(self, session: Session) -> None:
+        """Persist changes made to a loaded session"""
+    
+    @abstractmethod
+    async def load_session_summary(self, session_id: str) -> SessionSummary:
+        """Summary of a session for the final callback"""
+    
+    @abstractmethod
+    async def load_stats(self) -> SessionStats:
+        """Session counts for the stats endpoint"""
+    
+    async def expiry_loop(self, interval: float = CLEANUP_INTERVAL) -> None:
+        """Background expiry, for backends that need it"""
+    
+    async def close(self) -> None:
+        """Release backend resources"""
     
     def _calculate_risk_level(self, confidence: float) -> str:
         """Calculate risk level based on confidence score"""
-        if confidence >= 0.8:
-            return "high"
-        elif confidence >= 0.6:
-            return "medium"
-        elif confidence >= 0.4:
-            return "low"
-        else:
-            return "very_low"
+        return RISK_LEVELS[bisect_right(RISK_THRESHOLDS, confidence)]
     
-    def _calculate_engagement_score(self, session: Dict[str, Any]) -> float:
+    def _calculate_engagement_score(self, session: Session, total: int) -> float:
         """Calculate engagement score based on conversation metrics"""
-        base_score = min(session["totalMessagesExchanged"] * 0.1, 1.0)
-        scammer_ratio = session["scammerMessagesCount"] / max(session["totalMessagesExchanged"], 1)
-        intelligence_score = min(len([k for k in session["intelligence"].values() if k]) * 0.2, 1.0)
-        
-        return (base_score + scammer_ratio + intelligence_score) / 3
-    
-    def _cleanup_expired_sessions(self, current_time: float) -> None:
-        """Remove expired sessions to prevent memory leaks"""
-        expired_sessions = [
-            session_id for session_id, session in self.sessions.items()
-            if current_time - session["lastActivity"] > self.session_timeout
-        ]
-        
-        for session_id in expired_sessions:
-            del self.sessions[session_id]
+        nonempty = sum(1 for items in session.intelligence.values() if items)
+        return engagement_score(total, session.scammer_messages_count, nonempty)
     
-    def get_session_summary(self, session_id: str) -> Dict[str, Any]:
-        """Get a summary of the session for final callback"""
-        session = self.get_session(session_id)
-        
+    def session_summary(self, session: Session) -> SessionSummary:
+        """Summary of an already loaded session"""
         return {
-            "sessionId": session_id,
-            "scamDetected": session["scamDetected"],
-            "totalMessagesExchanged": session["totalMessagesExchanged"],
-            "scamConfidence": session["scamConfidence"],
-            "riskLevel": session["riskLevel"],
-            "engagementScore": session["engagementScore"],
-            "extractedIntelligence": session["intelligence"],
-            "conversationDuration": session["lastActivity"] - session["startTime"],
+            "sessionId": session.session_id,
+            "scamDetected": session.scam_detected,
+            "totalMessagesExchanged": session.total_messages_exchanged,
+            "scamConfidence": session.scam_confidence,
+            "riskLevel": session.risk_level,
+            "engagementScore": session.engagement_score,
+            "extractedIntelligence": session.intelligence,
+            "conversationDuration": session.last_activity - session.start_time,
             "agentNotes": self._generate_agent_notes(session)
         }
     
-    def _generate_agent_notes(self, session: Dict[str, Any]) -> str:
+    def _generate_agent_notes(self, session: Session) -> str:
         """Generate intelligent notes about the scammer behavior"""
+        if session.agent_notes is not None:
+            return session.agent_notes
+        
         notes = []
         
-        if session["scamDetected"]:
-            notes.append(f"Scam detected with {session['scamConfidence']:.2f} confidence")
+        if session.scam_detected:
+            notes.append(f"Scam detected with {session.scam_confidence:.2f} confidence")
         
-        if session["intelligence"]["suspiciousKeywords"]:
-            keywords = ", ".join(session["intelligence"]["suspiciousKeywords"][:5])
+        if session.intelligence["suspiciousKeywords"]:
+            keywords = ", ".join(session.intelligence["suspiciousKeywords"][:5])
             notes.append(f"Used keywords: {keywords}")
         
-        if session["intelligence"]["upiIds"]:
+        if session.intelligence["upiIds"]:
             notes.append(f"Requested UPI payments")
         
-        if session["intelligence"]["phishingLinks"]:
+        if session.intelligence["phishingLinks"]:
             notes.append(f"Shared suspicious links")
         
-        if session["intelligence"]["phoneNumbers"]:
+        if session.intelligence["phoneNumbers"]:
             notes.append(f"Provided contact numbers")
         
-        if session["engagementScore"] > 0.7:
+        if session.engagement_score > 0.7:
             notes.append("High engagement - persistent scammer")
-        elif session["engagementScore"] < 0.3:
+        elif session.engagement_score < 0.3:
             notes.append("Low engagement - quick exit")
         
-        return "; ".join(notes) if notes else "Suspicious activity detected"
+        session.agent_notes = "; ".join(notes) if notes else "Suspicious activity detected"
+        return session.agent_notes
+
+class SessionManager(SessionBackend):
+    """Sessions held in process memory"""
+    __slots__ = ("sessions", "max_sessions", "total_sessions", "active_sessions", "scam_sessions")
+    
+    def __init__(self, max_sessions: int = MAX_SESSIONS):
+        super().__init__()
+        # Kept in least-recently-used order: every access moves a session to
+        # the end, so the front is always the next one to expire
+        self.sessions: "OrderedDict[str, Session]" = OrderedDict()
+        self.max_sessions = max_sessions
+        # Running counts so stats never have to scan every session
+        self.total_sessions = 0
+        self.active_sessions = 0
+        self.scam_sessions = 0
+        
+    def get_session(self, session_id: str) -> Session:
+        """
+        Get or create a session with enhanced tracking
+        """
+        current_time = time.time()
+        
+        # Expiry sweeps run in expiry_loop; only the requested session is
+        # checked here so it is never served stale
+        session = self.sessions.get(session_id)
+        if session is not None and current_time - session.last_activity > self.session_timeout:
+            self._evict(session_id)
+        
+        if session_id not in self.sessions:
+            self.sessions[session_id] = Session(session_id, current_time)
+            self.total_sessions += 1
+            self.active_sessions += 1
+            
+            # Hard bound on memory: drop least recently used sessions
+            while len(self.sessions) > self.max_sessions:
+                self._evict(next(iter(self.sessions)))
+        else:
+            self.sessions.move_to_end(session_id)
+        
+        # Update last activity
+        session = self.sessions[session_id]
+        session.last_activity = current_time
+        
+        return session
+    
+    def update_session(self, session_id: str, message: Dict[str, Any], 
+                      scam_detected: bool = False, confidence: float = 0.0) -> None:
+        """
+        Update session with new message and analysis
+        """
+        self.record_message(self.get_session(session_id), message, scam_detected, confidence)
+    
+    def record_message(self, session: Session, message: Dict[str, Any],
+                       scam_detected: bool = False, confidence: float = 0.0) -> None:
+        """Add a message to a session, counting it as a scam session on first detection"""
+        if scam_detected and not session.scam_detected:
+            self.scam_sessions += 1
+        super().record_message(session, message, scam_detected, confidence)
+    
+    def complete_session(self, session: Session) -> None:
+        """Mark an already loaded session as completed"""
+        if not session.completed:
+            self.active_sessions -= 1
+        super().complete_session(session)
+    
+    async def load_session(self, session_id: str) -> Session:
+        """Get or create a session"""
+        return self.get_session(session_id)
+    
+    async def save_session(self, session: Session) -> None:
+        """Nothing to persist: in memory, loaded sessions are live"""
+    
+    async def load_session_summary(self, session_id: str) -> SessionSummary:
+        """Async get_session_summary"""
+        return self.get_session_summary(session_id)
+    
+    async def load_stats(self) -> SessionStats:
+        """Async get_stats"""
+        return self.get_stats()
+    
+    def _cleanup_expired_sessions(self, current_time: float) -> None:
+        """Remove expired sessions to prevent memory leaks"""
+        # The front of the OrderedDict is the least recently active session,
+        # so stop at the first session still live
+        while self.sessions:
+            session_id, session = next(iter(self.sessions.items()))
+            if current_time - session.last_activity <= self.session_timeout:
+                break
+            self._evict(session_id)
+    
+    async def expiry_loop(self, interval: float = CLEANUP_INTERVAL) -> None:
+        """Sweep expired sessions every interval seconds until cancelled"""
+        while True:
+            await asyncio.sleep(interval)
+            self._cleanup_expired_sessions(time.time())
+    
+    def _evict(self, session_id: str) -> None:
+        """Remove a session and take it out of the running counts"""
+        session = self.sessions.pop(session_id)
+        self._locks.pop(session_id, None)
+        self.total_sessions -= 1
+        if not session.completed:
+            self.active_sessions -= 1
+        if session.scam_detected:
+            self.scam_sessions -= 1
+    
+    def get_stats(self) -> SessionStats:
+        """Session counts, maintained incrementally"""
+        return {
+            "totalSessions": self.total_sessions,
+            "activeSessions": self.active_sessions,
+            "scamSessions": self.scam_sessions
+        }
+    
+    def get_session_summary(self, session_id: str) -> SessionSummary:
+        """Get a summary of the session for final callback"""
+        return self.session_summary(self.get_session(session_id))
     
     def mark_completed(self, session_id: str) -> None:
         """Mark session as completed"""
-        if session_id in self.sessions:
-            self.sessions[session_id]["completed"] = True
+        session = self.sessions.get(session_id)
+        if session is not None:
+            self.complete_session(session)
 
 # Global session manager instance
 session_manager = SessionManager()
 
-def get_session(session_id: str) -> Dict[str, Any]:
+def get_session(session_id: str) -> Session:
     """Backward compatibility function"""
     return session_manager.get_session(session_id)
 
@@ -172,7 +406,7 @@ def update_session(session_id: str, message: Dict[str, Any],
     """Update session with new message"""
     session_manager.update_session(session_id, message, scam_detected, confidence)
 
-def get_session_summary(session_id: str) -> Dict[str, Any]:
+def get_session_summary(session_id: str) -> SessionSummary:
     """Get session summary for callback"""
     return session_manager.get_session_summary(session_id)
 
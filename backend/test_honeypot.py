@@ -9,58 +9,148 @@ from main import app
 from detector import calculate_scam_score, detect_scam
 from extractor import extract_intelligence
 from agent import agent_reply
-from session_store import get_session, update_session, get_session_summary
+from session_store import HISTORY_LIMIT, SessionManager, get_session, update_session, get_session_summary
 
-client = TestClient(app)
+@pytest.fixture(scope="session")
+def client():
+    """One TestClient shared by every API test"""
+    return TestClient(app)
+
+class FakeRedisPipeline:
+    """In-memory stand-in for a redis.asyncio pipeline, covering the commands the Redis backend uses"""
+    
+    def __init__(self, redis):
+        self.data = redis.data
+        self.pushes = redis.pushes
+        self.commands = []
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc_info):
+        return False
+    
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: self.commands.append((name, args, kwargs))
+    
+    async def execute(self):
+        # Yield like a network round trip would
+        await asyncio.sleep(0)
+        results = [getattr(self, "_" + name)(*args, **kwargs) for name, args, kwargs in self.commands]
+        self.commands = []
+        return results
+    
+    def _hgetall(self, key):
+        return dict(self.data.get(key, {}))
+    
+    def _hset(self, key, mapping):
+        self.data.setdefault(key, {}).update({field: value.decode() for field, value in mapping.items()})
+    
+    def _lrange(self, key, start, end):
+        return list(self.data.get(key, []))
+    
+    def _rpush(self, key, *values):
+        self.pushes.append(len(values))
+        self.data.setdefault(key, []).extend(value.decode() for value in values)
+    
+    def _ltrim(self, key, start, end):
+        self.data[key] = self.data[key][start:][:end - start + 1 if end >= 0 else None]
+    
+    def _expire(self, key, seconds):
+        return True
+    
+    def _zadd(self, key, mapping):
+        self.data.setdefault(key, {}).update(mapping)
+    
+    def _zremrangebyscore(self, key, low, high):
+        members = self.data.setdefault(key, {})
+        for member in [member for member, score in members.items() if score <= high]:
+            del members[member]
+    
+    def _zcard(self, key):
+        return len(self.data.get(key, {}))
+
+class FakeRedisLock:
+    """In-memory stand-in for a redis.asyncio lock, without expiry"""
+    
+    def __init__(self, redis, name):
+        self.data = redis.data
+        self.name = name
+    
+    async def acquire(self):
+        while self.name in self.data:
+            await asyncio.sleep(0)
+        self.data[self.name] = "1"
+        return True
+    
+    async def release(self):
+        del self.data[self.name]
+
+class FakeRedis:
+    """In-memory stand-in for redis.asyncio.Redis"""
+    
+    def __init__(self):
+        self.data = {}
+        # Number of values in each RPUSH
+        self.pushes = []
+    
+    def pipeline(self, transaction=True):
+        return FakeRedisPipeline(self)
+    
+    def lock(self, name, **kwargs):
+        return FakeRedisLock(self, name)
+
+@pytest.fixture
+def redis_manager():
+    """RedisSessionManager backed by FakeRedis"""
+    pytest.importorskip("redis")
+    from redis_store import RedisSessionManager
+    manager = RedisSessionManager("redis://localhost:6379/0")
+    manager.redis = FakeRedis()
+    return manager
 
 class TestScamDetection:
     """Test scam detection functionality"""
     
-    def test_obvious_scam_detection(self):
+    @pytest.mark.parametrize("message", [
+        "Your bank account will be blocked today. Verify immediately.",
+        "URGENT: Your account has been suspended. Click here to verify.",
+        "Congratulations! You won $1000000. Send your bank details.",
+        "Your KYC will expire today. Update immediately or account blocked."
+    ])
+    def test_obvious_scam_detection(self, message):
         """Test detection of obvious scam messages"""
-        scam_messages = [
-            "Your bank account will be blocked today. Verify immediately.",
-            "URGENT: Your account has been suspended. Click here to verify.",
-            "Congratulations! You won $1000000. Send your bank details.",
-            "Your KYC will expire today. Update immediately or account blocked."
-        ]
-        
-        for message in scam_messages:
-            is_scam, keywords, confidence = calculate_scam_score(message)
-            assert is_scam, f"Failed to detect scam in: {message}"
-            assert confidence >= 0.4, f"Low confidence for obvious scam: {confidence}"
-            assert len(keywords) > 0, f"No keywords detected for: {message}"
+        is_scam, keywords, confidence = calculate_scam_score(message)
+        assert is_scam, f"Failed to detect scam in: {message}"
+        assert confidence >= 0.4, f"Low confidence for obvious scam: {confidence}"
+        assert len(keywords) > 0, f"No keywords detected for: {message}"
     
-    def test_legitimate_message_detection(self):
+    @pytest.mark.parametrize("message", [
+        "Hi, how are you doing today?",
+        "Meeting scheduled for tomorrow at 3 PM.",
+        "Thanks for your help with the project.",
+        "Can you send me the report when you get a chance?"
+    ])
+    def test_legitimate_message_detection(self, message):
         """Test that legitimate messages are not flagged as scams"""
-        legitimate_messages = [
-            "Hi, how are you doing today?",
-            "Meeting scheduled for tomorrow at 3 PM.",
-            "Thanks for your help with the project.",
-            "Can you send me the report when you get a chance?"
-        ]
-        
-        for message in legitimate_messages:
-            is_scam, keywords, confidence = calculate_scam_score(message)
-            assert not is_scam, f"False positive for legitimate message: {message}"
-            assert confidence < 0.4, f"High confidence for legitimate message: {confidence}"
+        is_scam, keywords, confidence = calculate_scam_score(message)
+        assert not is_scam, f"False positive for legitimate message: {message}"
+        assert confidence < 0.4, f"High confidence for legitimate message: {confidence}"
     
-    def test_edge_cases(self):
+    @pytest.mark.parametrize("message", [
+        "",  # Empty message
+        "bank",  # Single keyword
+        "URGENT URGENT URGENT",  # Repeated urgency
+        "Click here http://example.com verify account",  # Mixed patterns
+    ])
+    def test_edge_cases(self, message):
         """Test edge cases and boundary conditions"""
-        edge_cases = [
-            "",  # Empty message
-            "bank",  # Single keyword
-            "URGENT URGENT URGENT",  # Repeated urgency
-            "Click here http://example.com verify account",  # Mixed patterns
-        ]
-        
-        for message in edge_cases:
-            is_scam, keywords, confidence = calculate_scam_score(message)
-            # Should handle gracefully without errors
-            assert isinstance(is_scam, bool)
-            assert isinstance(keywords, list)
-            assert isinstance(confidence, float)
-            assert 0 <= confidence <= 1
+        is_scam, keywords, confidence = calculate_scam_score(message)
+        # Should handle gracefully without errors
+        assert isinstance(is_scam, bool)
+        assert isinstance(keywords, list)
+        assert isinstance(confidence, float)
+        assert 0 <= confidence <= 1
 
 class TestIntelligenceExtraction:
     """Test intelligence extraction functionality"""
@@ -100,6 +190,23 @@ class TestIntelligenceExtraction:
         
         result = extract_intelligence(text, intel)
         assert len(result["bankAccounts"]) >= 1
+    
+    def test_overlapping_patterns_reported_once(self):
+        """Test that a match is not repeated as a truncated variant"""
+        text = "Visit https://fake-bank.com/verify or mail john.doe@example.co.in"
+        intel = {"upiIds": [], "phoneNumbers": [], "phishingLinks": [], "bankAccounts": [], "suspiciousKeywords": []}
+        
+        result = extract_intelligence(text, intel)
+        assert "fake-bank.com/verify" not in result["phishingLinks"]
+        assert result["upiIds"] == ["john.doe@example.co.in"]
+    
+    def test_long_phone_number_not_truncated(self):
+        """Test that a +91 number with extra digits is reported whole"""
+        text = "Call +9198765432101 now"
+        intel = {"upiIds": [], "phoneNumbers": [], "phishingLinks": [], "bankAccounts": [], "suspiciousKeywords": []}
+        
+        result = extract_intelligence(text, intel)
+        assert result["phoneNumbers"] == ["+9198765432101"]
 
 class TestAgentResponses:
     """Test AI agent response generation"""
@@ -140,10 +247,10 @@ class TestSessionManagement:
         session_id = "test-session-123"
         session = get_session(session_id)
         
-        assert session["sessionId"] == session_id
-        assert session["scamDetected"] == False
-        assert session["totalMessagesExchanged"] == 0
-        assert isinstance(session["intelligence"], dict)
+        assert session.session_id == session_id
+        assert session.scam_detected == False
+        assert session.total_messages_exchanged == 0
+        assert isinstance(session.intelligence, dict)
     
     def test_session_update(self):
         """Test session update with message"""
@@ -153,9 +260,9 @@ class TestSessionManagement:
         update_session(session_id, message, True, 0.8)
         session = get_session(session_id)
         
-        assert session["scamDetected"] == True
-        assert session["scamConfidence"] == 0.8
-        assert session["totalMessagesExchanged"] == 1
+        assert session.scam_detected == True
+        assert session.scam_confidence == 0.8
+        assert session.total_messages_exchanged == 1
     
     def test_session_summary(self):
         """Test session summary generation"""
@@ -169,11 +276,182 @@ class TestSessionManagement:
         assert summary["scamDetected"] == True
         assert summary["totalMessagesExchanged"] == 1
         assert "agentNotes" in summary
+        
+        # Notes are cached until the next message changes the session
+        update_session(session_id, {"sender": "user", "text": "Who is this?", "timestamp": 1234567891})
+        assert get_session_summary(session_id)["agentNotes"] != summary["agentNotes"]
+    
+    def test_session_as_dict_serializable(self):
+        """Test that the session view serializes after the agent has cached tokens"""
+        manager = SessionManager()
+        manager.update_session("as-dict", {"sender": "scammer", "text": "Share your UPI now", "timestamp": 1234567890})
+        session = manager.get_session("as-dict")
+        agent_reply(session.messages)
+        
+        data = json.loads(json.dumps(session.as_dict()))
+        assert data["messages"] == [{"sender": "scammer", "text": "Share your UPI now", "timestamp": 1234567890}]
+    
+    def test_session_counters(self):
+        """Test running session counts across completion and expiry"""
+        manager = SessionManager()
+        message = {"sender": "scammer", "text": "Send money to scammer@upi", "timestamp": 1234567890}
+        
+        manager.update_session("counter-a", message, True, 0.9)
+        manager.get_session("counter-b")
+        manager.mark_completed("counter-a")
+        assert manager.get_stats() == {"totalSessions": 2, "activeSessions": 1, "scamSessions": 1}
+        
+        manager._cleanup_expired_sessions(time.time() + 2 * manager.session_timeout)
+        assert manager.get_stats() == {"totalSessions": 0, "activeSessions": 0, "scamSessions": 0}
+    
+    def test_session_history_bound(self):
+        """Test that old messages age out while the message count keeps going"""
+        manager = SessionManager()
+        message = {"sender": "scammer", "text": "Urgent verification needed", "timestamp": 1234567890}
+        for _ in range(HISTORY_LIMIT + 10):
+            manager.update_session("bounded", message)
+        
+        session = manager.get_session("bounded")
+        assert len(session.messages) == HISTORY_LIMIT
+        assert session.total_messages_exchanged == HISTORY_LIMIT + 10
+    
+    def test_session_expiry_order(self):
+        """Test that a recently used session outlives older ones"""
+        manager = SessionManager()
+        manager.get_session("lru-a")
+        manager.get_session("lru-b")
+        manager.get_session("lru-a")
+        assert list(manager.sessions) == ["lru-b", "lru-a"]
+        
+        manager.sessions["lru-b"].last_activity -= 10
+        manager._cleanup_expired_sessions(time.time() + manager.session_timeout - 5)
+        assert list(manager.sessions) == ["lru-a"]
+    
+    def test_session_lru_bound(self):
+        """Test that the least recently used session is evicted at capacity"""
+        manager = SessionManager(max_sessions=2)
+        manager.get_session("lru-a")
+        manager.get_session("lru-b")
+        manager.get_session("lru-a")
+        manager.get_session("lru-c")
+        
+        assert list(manager.sessions) == ["lru-a", "lru-c"]
+        assert manager.get_stats()["totalSessions"] == 2
+
+class TestRedisSessionStore:
+    """Test the Redis session backend against an in-memory fake"""
+    
+    def test_round_trip(self, redis_manager):
+        """Test that a saved session loads back with its messages and intelligence"""
+        async def run():
+            session = await redis_manager.load_session("redis-a")
+            redis_manager.record_message(session, {"sender": "scammer", "text": "Pay to scam@upi", "timestamp": 1}, True, 0.9)
+            extract_intelligence("Pay to scam@upi", session.intelligence, seen=session.intelligence_seen)
+            agent_reply(session.messages)
+            await redis_manager.save_session(session)
+            
+            loaded = await redis_manager.load_session("redis-a")
+            redis_manager.record_message(loaded, {"sender": "user", "text": "Who is this?", "timestamp": 2})
+            await redis_manager.save_session(loaded)
+            return loaded, await redis_manager.load_session("redis-a")
+        
+        loaded, reloaded = asyncio.run(run())
+        assert loaded.scam_detected and loaded.scam_confidence == 0.9
+        assert loaded.intelligence_seen["upiIds"] == {"scam@upi"}
+        assert list(reloaded.messages) == [
+            {"sender": "scammer", "text": "Pay to scam@upi", "timestamp": 1},
+            {"sender": "user", "text": "Who is this?", "timestamp": 2}
+        ]
+        assert reloaded.total_messages_exchanged == 2
+        # Each save pushes only the messages recorded since the load
+        assert redis_manager.redis.pushes == [1, 1]
+    
+    def test_messages_trimmed(self, redis_manager):
+        """Test that only recent messages are kept in Redis"""
+        async def run():
+            for _ in range(2):
+                session = await redis_manager.load_session("redis-b")
+                for i in range(HISTORY_LIMIT // 2 + 5):
+                    redis_manager.record_message(session, {"sender": "scammer", "text": str(i), "timestamp": i})
+                await redis_manager.save_session(session)
+            return await redis_manager.load_session("redis-b")
+        
+        session = asyncio.run(run())
+        assert len(redis_manager.redis.data["session:redis-b:messages"]) == HISTORY_LIMIT
+        assert session.messages[-1]["text"] == str(HISTORY_LIMIT // 2 + 4)
+        assert session.total_messages_exchanged == HISTORY_LIMIT + 10
+    
+    def test_stats(self, redis_manager):
+        """Test stats counts and pruning of expired sessions"""
+        async def run():
+            scam = await redis_manager.load_session("redis-scam")
+            redis_manager.record_message(scam, {"sender": "scammer", "text": "Urgent", "timestamp": 1}, True, 0.9)
+            redis_manager.complete_session(scam)
+            await redis_manager.save_session(scam)
+            await redis_manager.save_session(await redis_manager.load_session("redis-benign"))
+            stats = await redis_manager.load_stats()
+            
+            # Expired ids are dropped on the next save, without polling stats
+            for key in ("sessions:all", "sessions:completed", "sessions:scam"):
+                redis_manager.redis.data[key]["redis-scam"] -= 2 * redis_manager.session_timeout
+            await redis_manager.save_session(await redis_manager.load_session("redis-benign"))
+            return stats
+        
+        stats = asyncio.run(run())
+        assert stats == {"totalSessions": 2, "activeSessions": 1, "scamSessions": 1}
+        data = redis_manager.redis.data
+        assert list(data["sessions:all"]) == ["redis-benign"]
+        assert data["sessions:completed"] == {} and data["sessions:scam"] == {}
+    
+    def test_concurrent_requests_serialized(self, redis_manager, monkeypatch):
+        """Test that concurrent requests for one session do not lose updates"""
+        import main
+        monkeypatch.setattr(main, "sessions", redis_manager)
+        requests = [
+            main.HoneypotRequest(
+                sessionId="redis-concurrent",
+                message={"sender": "scammer", "text": f"Hello there {i}", "timestamp": i}
+            )
+            for i in range(10)
+        ]
+        
+        async def run():
+            await asyncio.gather(*(main.honeypot_message(request) for request in requests))
+            return await redis_manager.load_session("redis-concurrent")
+        
+        session = asyncio.run(run())
+        assert session.total_messages_exchanged == 10
+        assert len(session.messages) == 10
+    
+    def test_workers_share_session_lock(self, redis_manager):
+        """Test that workers with their own managers neither lose updates nor complete a session twice"""
+        from redis_store import RedisSessionManager
+        other_worker = RedisSessionManager("redis://localhost:6379/0")
+        other_worker.redis = redis_manager.redis
+        completions = []
+        
+        async def handle(manager, i):
+            async with manager.session_lock("redis-workers"):
+                session = await manager.load_session("redis-workers")
+                manager.record_message(session, {"sender": "scammer", "text": f"Pay now {i}", "timestamp": i}, True, 0.9)
+                if session.total_messages_exchanged >= 4 and not session.completed:
+                    manager.complete_session(session)
+                    completions.append(i)
+                await manager.save_session(session)
+        
+        async def run():
+            await asyncio.gather(*(handle((redis_manager, other_worker)[i % 2], i) for i in range(10)))
+            return await redis_manager.load_session("redis-workers")
+        
+        session = asyncio.run(run())
+        assert session.total_messages_exchanged == 10
+        assert len(completions) == 1
+        assert "session:redis-workers:lock" not in redis_manager.redis.data
 
 class TestAPIEndpoints:
     """Test API endpoints"""
     
-    def test_health_check(self):
+    def test_health_check(self, client):
         """Test health check endpoint"""
         response = client.get("/")
         assert response.status_code == 200
@@ -181,7 +459,7 @@ class TestAPIEndpoints:
         assert data["status"] == "healthy"
         assert "version" in data
     
-    def test_detailed_health_check(self):
+    def test_detailed_health_check(self, client):
         """Test detailed health check endpoint"""
         response = client.get("/health")
         assert response.status_code == 200
@@ -189,7 +467,7 @@ class TestAPIEndpoints:
         assert data["status"] == "healthy"
         assert "endpoints" in data
     
-    def test_unauthorized_access(self):
+    def test_unauthorized_access(self, client):
         """Test API without authentication"""
         payload = {
             "sessionId": "test-session",
@@ -203,8 +481,14 @@ class TestAPIEndpoints:
         response = client.post("/honeypot/message", json=payload)
         assert response.status_code == 401
     
+    def test_stats_authentication(self, client):
+        """Test that the stats endpoint shares the API key check"""
+        assert client.get("/stats").status_code == 401
+        assert client.get("/stats", headers={"x-api-key": "wrong"}).status_code == 401
+        assert client.get("/stats", headers={"x-api-key": "SECRET123"}).status_code == 200
+    
     @patch('main.send_final_callback')
-    def test_authorized_scam_message(self, mock_callback):
+    def test_authorized_scam_message(self, mock_callback, client):
         """Test API with authenticated scam message"""
         payload = {
             "sessionId": "test-session-scam",
@@ -225,7 +509,7 @@ class TestAPIEndpoints:
         assert "reply" in data
         assert data["confidence"] > 0.4
     
-    def test_legitimate_message_processing(self):
+    def test_legitimate_message_processing(self, client):
         """Test API with legitimate message"""
         payload = {
             "sessionId": "test-session-legit",
@@ -249,7 +533,7 @@ class TestIntegration:
     """Integration tests for the complete system"""
     
     @patch('main.send_final_callback')
-    def test_full_conversation_flow(self, mock_callback):
+    def test_full_conversation_flow(self, mock_callback, client):
         """Test complete conversation flow from start to callback"""
         session_id = "integration-test-session"
         headers = {"x-api-key": "SECRET123"}
@@ -295,9 +579,9 @@ class TestIntegration:
         
         # Verify session state
         session = get_session(session_id)
-        assert session["scamDetected"] == True
-        assert session["totalMessagesExchanged"] >= 2
-        assert len(session["intelligence"]["suspiciousKeywords"]) > 0
+        assert session.scam_detected == True
+        assert session.total_messages_exchanged >= 2
+        assert len(session.intelligence["suspiciousKeywords"]) > 0
 
 if __name__ == "__main__":
     pytest.main([__file__, "-v"])